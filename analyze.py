@@ -16,36 +16,163 @@
 import os
 import argparse
 from pymavlink import mavutil
+from pymavlink import DFReader
 from collections import defaultdict
+from array import array
 import numpy as np
 import fnmatch
+import math
 
+# Number of buffered values per field reduced with NumPy in one go
+BATCH_SIZE = 4096
 
-def analyze_mavlink_log(logfile_path, msg_name=None, print_msgs=False):
-    # Check if the file exists
-    if not os.path.exists(logfile_path):
-        print(f"Error: Log file '{logfile_path}' not found.")
-        return
+# NumPy dtypes for the numeric struct codes used by DataFlash formats
+STRUCT_TO_DTYPE = {
+    'b': 'i1', 'B': 'u1', 'h': '<i2', 'H': '<u2', 'i': '<i4', 'I': '<u4',
+    'q': '<i8', 'Q': '<u8', 'e': '<f2', 'f': '<f4', 'd': '<f8',
+}
+# DataFlash format characters that decode to strings or arrays
+NON_NUMERIC_FORMATS = 'nNZa'
+# Sync bytes at the start of every DataFlash message
+DF_HEADER = b'\xa3\x95'
+# Type id of the DataFlash FMT message
+DF_FMT_TYPE = 0x80
 
-    # Open the MAVLink log file in binary mode
-    print(f"Opening log file: {logfile_path}")
-    try:
-        mlog = mavutil.mavlink_connection(logfile_path)
-    except Exception as e:
-        print(f"Error opening log file: {e}")
-        return
 
-    # Dictionaries to store stats
-    message_counts = defaultdict(int)  # Count of each message type
-    # Store values for each field in each message type
-    field_values = defaultdict(list)
+def fold_values(stats, arr):
+    """Fold an array of values into running [count, sum, min, max] stats."""
+    stats[0] += arr.size
+    stats[1] += arr.sum()
+    # fmin/fmax ignore NaN ("no data" in many logs) unless every value is NaN
+    stats[2] = np.fmin(stats[2], np.fmin.reduce(arr))
+    stats[3] = np.fmax(stats[3], np.fmax.reduce(arr))
+
+
+def numeric_fields(msg, binary_log):
+    """Return the names of the numeric fields of a message's type."""
+    if binary_log:
+        # Binary DataFlash formats state each field's type up front; text logs
+        # do not apply multipliers, so there e.g. 'M' mode fields stay strings
+        fmt = msg.fmt
+        return tuple(name for name, fmt_char in zip(fmt.columns, fmt.msg_fmts)
+                     if fmt_char not in NON_NUMERIC_FORMATS)
+    return tuple(name for name in msg.get_fieldnames()
+                 if isinstance(getattr(msg, name), (int, float)))
+
+
+def complete_message_count(mlog):
+    """Count the indexed messages of a binary DataFlash log that are fully written."""
+    return sum(int(np.count_nonzero(np.asarray(mlog.offsets[type_id], dtype=np.int64) + fmt.len <= mlog.data_len))
+               for type_id, fmt in mlog.formats.items() if mlog.counts[type_id])
+
+
+def index_covers_log(mlog):
+    """
+    Check that the DFReader index of a binary DataFlash log reaches the end of the log.
+    The indexer stops at the first message header whose type id has no FMT, while
+    reading message by message skips past it, so a valid header after the last
+    indexed message means the index misses the rest of the log.
+    """
+    index_end = max((mlog.offsets[type_id][-1] + fmt.len for type_id, fmt in mlog.formats.items()
+                     if mlog.counts[type_id]), default=0)
+    # Anything after the last indexed message that is not a message header is trailing garbage
+    ofs = mlog.data_map.find(DF_HEADER, index_end)
+    while ofs != -1:
+        if ofs + 2 < mlog.data_len and mlog.data_map[ofs + 2] in mlog.formats:
+            return False
+        ofs = mlog.data_map.find(DF_HEADER, ofs + 1)
+    return True
+
+
+def redefined_type_ids(mlog):
+    """Return the type ids that a binary DataFlash log defines with more than one FMT message."""
+    fmt_len = mlog.formats[DF_FMT_TYPE].len if DF_FMT_TYPE in mlog.formats else 0
+    definitions = defaultdict(set)
+    for ofs in mlog.offsets[DF_FMT_TYPE]:
+        if ofs + fmt_len <= mlog.data_len:
+            definitions[mlog.data_map[ofs + 3]].add(mlog.data_map[ofs + 3:ofs + fmt_len])
+    return {type_id for type_id, bodies in definitions.items() if len(bodies) > 1}
+
+
+def analyze_binary_log(mlog, msg_name, message_counts, field_stats):
+    """
+    Collect message counts and field stats from a binary DataFlash log by
+    decoding all messages of a type at once as a NumPy structured array.
+    Returns the type ids that have to be decoded message by message instead.
+    """
+    data = np.frombuffer(mlog.data_map, dtype=np.uint8)
+    # The index only keeps the last FMT of a type, so redefined types are left to the caller
+    fallback_ids = redefined_type_ids(mlog)
+    for type_id, fmt in sorted(mlog.formats.items()):
+        if mlog.counts[type_id] == 0 or (msg_name and not fnmatch.fnmatch(fmt.name, msg_name)):
+            continue
+        if type_id in fallback_ids:
+            continue
+        # The index also holds a partly written message at the end of the log
+        offsets = np.asarray(mlog.offsets[type_id], dtype=np.int64)
+        offsets = offsets[offsets + fmt.len <= mlog.data_len]
+        count = offsets.size
+        if count == 0:
+            continue
+        if not fmt.msg_fmts:
+            message_counts[fmt.name] += count
+            continue  # No fields to collect
+
+        # Describe the message payload; strings become fixed size byte fields
+        dtype_fields = []
+        for i, fmt_char in enumerate(fmt.msg_fmts):
+            name = fmt.columns[i] if i < len(fmt.columns) else f"_{i}"
+            struct_code = DFReader.FORMAT_TO_STRUCT[fmt_char][0]
+            dtype_fields.append((name, STRUCT_TO_DTYPE.get(struct_code, f"S{struct_code[:-1]}")))
+        try:
+            dtype = np.dtype(dtype_fields)
+        except (TypeError, ValueError):
+            fallback_ids.add(type_id)
+            continue
+        if dtype.itemsize != fmt.len - 3:
+            fallback_ids.add(type_id)
+            continue
+        message_counts[fmt.name] += count
+
+        # Gather the payloads into a buffer sized from the indexed message count,
+        # one byte column at a time rather than one message at a time
+        starts = offsets + 3
+        payloads = np.empty((count, fmt.len - 3), dtype=np.uint8)
+        for j in range(fmt.len - 3):
+            payloads[:, j] = data[starts + j]
+        records = payloads.view(dtype)[:, 0]
+        for i, (name, _) in enumerate(dtype_fields):
+            if i >= len(fmt.columns) or fmt.msg_fmts[i] in NON_NUMERIC_FORMATS:
+                continue
+            values = records[name].astype(np.float64)
+            # Apply the multiplier the same way DFMessage does
+            mult = fmt.msg_mults[i]
+            if mult is not None:
+                if 0.0 < mult < 1.0:
+                    values /= 1 / mult
+                else:
+                    values *= mult
+            fold_values(field_stats[f"{fmt.name}.{name}"], values)
+
+    return fallback_ids
+
+
+def analyze_messages(mlog, msg_name, match_type, print_msgs, message_counts, field_stats, type_ids=None):
+    """
+    Collect message counts and field stats by reading the log message by message.
+    If type_ids is given, only binary DataFlash messages with those type ids are collected.
+    Returns the number of messages read.
+    """
+    binary_log = isinstance(mlog, DFReader.DFReader_binary)
+    # Values not yet folded into field_stats, packed as C doubles
+    pending_values = defaultdict(lambda: array('d'))
+    # Numeric field names of each message type, worked out on first sight
+    numeric_field_names = {}
 
-    # Read through the log
-    print("Analyzing log file...")
     msg_count = 0
     while True:
         try:
-            msg = mlog.recv_msg()
+            msg = mlog.recv_match(type=match_type, blocking=False)
             if msg is None:  # End of log
                 break
 
@@ -58,16 +185,26 @@ def analyze_mavlink_log(logfile_path, msg_name=None, print_msgs=False):
             if msg_name and not fnmatch.fnmatch(msg_type, msg_name):
                 continue
 
+            # Redefined binary types are the only ones left to collect here
+            if type_ids is not None and msg.fmt.type not in type_ids:
+                continue
+
             # Update message count
             message_counts[msg_type] += 1
 
-            # Extract fields and store numeric values
-            fields = msg.to_dict()
-            for field_name, value in fields.items():
-                # Skip non-numeric fields and mavpackettype
-                if isinstance(value, (int, float)) and field_name != "mavpackettype":
-                    field_key = f"{msg_type}.{field_name}"
-                    field_values[field_key].append(value)
+            # Read numeric fields directly and buffer their values for batch reduction
+            # Binary formats may be redefined part-way, so key those by format
+            names_key = msg.fmt if binary_log else msg_type
+            field_names = numeric_field_names.get(names_key)
+            if field_names is None:
+                field_names = numeric_field_names[names_key] = numeric_fields(msg, binary_log)
+            for field_name in field_names:
+                field_key = f"{msg_type}.{field_name}"
+                values = pending_values[field_key]
+                values.append(getattr(msg, field_name))
+                if len(values) >= BATCH_SIZE:
+                    fold_values(field_stats[field_key], np.frombuffer(values))
+                    del values[:]
 
             # Print the message if the --print_msgs flag is set
             if print_msgs:
@@ -77,6 +214,71 @@ def analyze_mavlink_log(logfile_path, msg_name=None, print_msgs=False):
             print(f"Error processing message: {e}")
             break
 
+    # Fold whatever is left in the buffers
+    for field_key, values in pending_values.items():
+        if len(values) > 0:
+            fold_values(field_stats[field_key], np.frombuffer(values))
+
+    return msg_count
+
+
+def analyze_mavlink_log(logfile_path, msg_name=None, print_msgs=False):
+    # Check if the file exists
+    if not os.path.exists(logfile_path):
+        print(f"Error: Log file '{logfile_path}' not found.")
+        return
+
+    # Open the MAVLink log file in binary mode
+    print(f"Opening log file: {logfile_path}")
+    try:
+        mlog = mavutil.mavlink_connection(logfile_path)
+    except Exception as e:
+        print(f"Error opening log file: {e}")
+        return
+
+    # Dictionaries to store stats
+    message_counts = defaultdict(int)  # Count of each message type
+    # Running [count, sum, min, max] for each field in each message type
+    field_stats = defaultdict(lambda: [0, 0.0, math.nan, math.nan])
+
+    # Read through the log
+    print("Analyzing log file...")
+    # "Processed N messages." is the total number of messages in the log, filtered or not
+    if not isinstance(mlog, DFReader.DFReader_binary):
+        # Other logs are read in full so every message is counted
+        msg_count = analyze_messages(mlog, msg_name, None, print_msgs, message_counts, field_stats)
+    elif not index_covers_log(mlog):
+        # Anything the index or the type filter below would do misses the unindexed part of the log
+        print("Warning: log index stops before the end of the log, reading message by message")
+        msg_count = analyze_messages(mlog, msg_name, None, print_msgs, message_counts, field_stats)
+    elif print_msgs:
+        # The DFReader index knows every message type in a binary log, so the
+        # filter is resolved up front and pymavlink skips non-matching messages
+        # itself. Skipping by type would decode every message of a redefined type
+        # with its last FMT, so logs with one are read in full
+        match_type = None
+        if msg_name and not redefined_type_ids(mlog):
+            match_type = [name for name in mlog.name_to_id if fnmatch.fnmatch(name, msg_name)]
+        if match_type == []:
+            # No message type in the log matches, so there is nothing to read
+            msg_count = complete_message_count(mlog)
+        else:
+            msg_count = analyze_messages(mlog, msg_name, match_type, print_msgs, message_counts, field_stats)
+            if match_type:
+                # Only the matching messages were read, so take the total from the index
+                msg_count = complete_message_count(mlog)
+    else:
+        # Binary logs are indexed by message type, so decode each type in bulk
+        fallback_ids = analyze_binary_log(mlog, msg_name, message_counts, field_stats)
+        msg_count = complete_message_count(mlog)
+        if fallback_ids:
+            # Read the whole log in order for the types left over, as reading message by message
+            # always has; pymavlink unpacks a type id with its last FMT and drops messages written
+            # under an earlier one, so the total is taken from this read rather than the index
+            mlog.rewind()
+            msg_count = analyze_messages(mlog, msg_name, None, print_msgs, message_counts, field_stats,
+                                         fallback_ids)
+
     # Prepare output with proper line endings
     output_lines = []
     output_lines.append(f"Processed {msg_count} messages.\n")
@@ -87,27 +289,17 @@ def analyze_mavlink_log(logfile_path, msg_name=None, print_msgs=False):
 
     # Sort by count (descending), then by message type alphabetically for ties
     sorted_counts = sorted(message_counts.items(), key=lambda x: (-x[1], x[0]))
-    for msg_type, count in sorted_counts:
-        output_lines.append(f"{msg_type}: {count} messages\n")
+    output_lines.extend(f"{msg_type}: {count} messages\n" for msg_type, count in sorted_counts)
 
     output_lines.append("Field Statistics (fields with non-zero average):\n")
-    has_data = False
-    for field_key, values in sorted(field_values.items()):
-        if len(values) > 0:  # Only process fields with values
-            try:
-                min_val = min(values)
-                max_val = max(values)
-                avg_val = np.mean(values)
-                # Skip if average is effectively zero (with tolerance 1e-5)
-                if abs(avg_val) < 1e-5:
-                    continue
-                has_data = True
-                output_lines.append(
-                    f"{field_key}: Count={len(values)}, Min={min_val:.2f}, Max={max_val:.2f}, Average={avg_val:.2f}\n")
-            except Exception as e:
-                output_lines.append(f"{field_key}: Error={e}\n")
-
-    if not has_data:
+    # Skip fields whose average is effectively zero (with tolerance 1e-5)
+    field_lines = [
+        f"{field_key}: Count={count}, Min={min_val:.2f}, Max={max_val:.2f}, Average={total / count:.2f}\n"
+        for field_key, (count, total, min_val, max_val) in sorted(field_stats.items())
+        if not abs(total / count) < 1e-5]
+    output_lines.extend(field_lines)
+
+    if not field_lines:
         output_lines.append("No fields with non-zero average found.\n")
 
     # Display on screen
@@ -117,7 +309,7 @@ def analyze_mavlink_log(logfile_path, msg_name=None, print_msgs=False):
     output_file = logfile_path.replace('.bin', '_analysis.txt')
     try:
         with open(output_file, 'w', encoding='utf-8') as f:
-            f.write("".join(output_lines))
+            f.writelines(output_lines)
         print(f"Results saved to: {output_file}")
     except Exception as e:
         print(f"Error saving to file: {e}")
@@ -1,10 +1,17 @@
 import os
 import re
+import shutil
+
+# Copy files in 1 MiB blocks instead of loading them whole
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Digits right before the dot in a log file name, e.g. '00000012.BIN'
+LOG_NUMBER_RE = re.compile(r'(\d+)\.')
 
 
 def get_sort_key(filename):
     # Extract the digit before the dot in the filename
-    match = re.search(r'(\d+)\.', filename)
+    match = LOG_NUMBER_RE.search(filename)
     if match:
         return int(match.group(1))
     return 0
@@ -12,21 +19,22 @@ def get_sort_key(filename):
 
 def combine_files(directory, extension, output_file, name_starting_with):
     # Get the list of files in the directory with the given extension and starting with 'log'
-    files = sorted([f for f in os.listdir(directory) if f.startswith(name_starting_with) and f.endswith(extension) and os.path.isfile(os.path.join(directory, f))])
-
-    # Sort the files by the digit in their name after 'log' and before the dot
-    files.sort(key=get_sort_key)
+    # sorted by the digit in their name after 'log' and before the dot (name breaks ties)
+    with os.scandir(directory) as it:
+        files = sorted((e for e in it if e.name.startswith(name_starting_with) and e.name.endswith(extension) and e.is_file()),
+                       key=lambda e: (get_sort_key(e.name), e.name))
 
     output_file = os.path.join(directory, output_file)
 
     # Open the output file in binary write mode
-    with open(output_file, 'wb') as outfile:
-        for filename in files:
-            filepath = os.path.join(directory, filename)
-            print(f'Combining {filename}...')
-            # Open each file in binary read mode and write its contents to the output file
-            with open(filepath, 'rb') as infile:
-                outfile.write(infile.read())
+    with open(output_file, 'wb', buffering=COPY_BUFFER_SIZE) as outfile:
+        for entry in files:
+            print(f'Combining {entry.name}...')
+            # Open each file in binary read mode and stream its contents to the output file
+            with open(entry.path, 'rb') as infile:
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(infile.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                shutil.copyfileobj(infile, outfile, COPY_BUFFER_SIZE)
 
 
 # Usage example
@@ -44,8 +44,22 @@ def request_log_list(connection):
     return sorted(logs, key=lambda x: x['id'], reverse=True)
 
 
-def download_log(connection, log_id, log_size, output_dir="logs", retries=3, verbose=False):
-    """Download a specific log file by ID and save it as a .bin file."""
+def write_at(f, offset, data):
+    """Write data at the given offset of an unbuffered binary file."""
+    if hasattr(os, 'pwrite'):
+        os.pwrite(f.fileno(), data, offset)
+    else:
+        f.seek(offset)
+        f.write(data)
+
+
+def download_log(connection, log_id, log_size, output_dir="logs", retries=3, verbose=False, window=16):
+    """Download a specific log file by ID and save it as a .bin file.
+
+    Chunks are requested `window` at a time so the drone streams them back
+    without waiting for a request per chunk; missing chunks are re-requested.
+    Each chunk is written to the file as soon as it arrives.
+    """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
@@ -55,48 +69,69 @@ def download_log(connection, log_id, log_size, output_dir="logs", retries=3, ver
     print(f"Downloading log {log_id} ({log_size} bytes) to {filename}...")
 
     chunk_size = 90  # MAVLink max payload for LOG_DATA is ~90 bytes
-    offset = 0
-    log_data = bytearray()
-
-    for attempt in range(retries):
-        while offset < log_size:
+    num_chunks = (log_size + chunk_size - 1) // chunk_size
+    # One flag per chunk, set once the chunk has been stored
+    received = bytearray(num_chunks)
+    received_count = 0
+    received_bytes = 0
+    first_missing = 0
+    attempt = 0
+
+    # Write chunks straight to their offset in the file as they arrive
+    with open(filename, 'wb', buffering=0) as f:
+        while received_count < num_chunks and attempt < retries:
+            # Request a window starting at the first chunk still missing
+            while received[first_missing]:
+                first_missing += 1
+            window_start = first_missing * chunk_size
+            window_end = min(window_start + window * chunk_size, log_size)
             connection.mav.log_request_data_send(
                 connection.target_system,
                 connection.target_component,
                 log_id,
-                offset,
-                chunk_size
+                window_start,
+                window_end - window_start
             )
-            msg = connection.recv_match(
-                type='LOG_DATA', blocking=True, timeout=5)
-            if msg is None:
-                print(
-                    f"Timeout waiting for LOG_DATA for log {log_id}. Retrying...")
-                break
-            if msg.id != log_id:
-                print(f"Received wrong log ID: {msg.id} (expected {log_id}).")
-                continue
-            log_data.extend(msg.data[:msg.length])
-            offset += msg.length
-            if verbose:
-                print(
-                    f"Progress: {offset}/{log_size} bytes ({(offset/log_size)*100:.1f}%)")
-
-        if offset >= log_size:
-            break
-        else:
-            print(
-                f"Retrying download for log {log_id} (attempt {attempt + 1}/{retries})...")
-            offset = 0  # Reset offset for retry
-            log_data = bytearray()
 
-    if offset < log_size:
+            while True:
+                msg = connection.recv_match(
+                    type='LOG_DATA', blocking=True, timeout=5)
+                if msg is None:
+                    attempt += 1
+                    print(
+                        f"Timeout waiting for LOG_DATA for log {log_id}. "
+                        f"Retrying missing data (attempt {attempt}/{retries})...")
+                    break
+                if msg.id != log_id:
+                    print(f"Received wrong log ID: {msg.id} (expected {log_id}).")
+                    continue
+                if msg.ofs >= log_size or msg.ofs % chunk_size != 0:
+                    continue  # Not a chunk we asked for
+                if msg.count == 0:
+                    # The drone has no data at this offset
+                    attempt += 1
+                    break
+                index = msg.ofs // chunk_size
+                # Only the final chunk may be shorter; a short chunk before it
+                # stays missing and is requested again
+                length = min(chunk_size, log_size - msg.ofs)
+                if not received[index] and msg.count >= length:
+                    write_at(f, msg.ofs, bytes(msg.data[:length]))
+                    received[index] = 1
+                    received_count += 1
+                    received_bytes += length
+                    attempt = 0  # Progress was made, reset the retry budget
+                    if verbose:
+                        print(
+                            f"Progress: {received_bytes}/{log_size} bytes ({(received_bytes/log_size)*100:.1f}%)")
+                if msg.ofs + chunk_size >= window_end:
+                    break  # End of window; request the next missing range
+
+    if received_count < num_chunks:
         print(f"Failed to download log {log_id} after {retries} attempts.")
+        os.remove(filename)  # Do not leave a partial log behind
         return
 
-    # Write the log to a .bin file
-    with open(filename, 'wb') as f:
-        f.write(log_data[:log_size])  # Trim to exact size
     print(f"Log {log_id} downloaded successfully.")
 
 
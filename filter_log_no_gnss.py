@@ -14,11 +14,40 @@
 # Date: March 2025
 
 import os
-import sys
+import argparse
+import struct
 from collections import defaultdict
 from pymavlink import mavutil
+from pymavlink import DFReader
 from pymavlink.dialects.v20 import ardupilotmega
 
+# Output buffer size; messages are only tens of bytes each, so batch the writes
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Fields holding GNSS location data (latitude, longitude, altitude) per message type.
+# Missing fields read as 0, so messages without them are never filtered.
+GNSS_LOCATION_FIELDS = {
+    'GPS': ('Lat', 'Lon'),
+    'POS': ('Lat', 'Lng'),
+    'ORGN': ('Lat', 'Lng'),
+    'TERR': ('Lat', 'Lng'),
+    'AHR2': ('Lat', 'Lng'),
+    'EAHR': ('Lat', 'Lon'),
+    'MISSION_ITEM': ('x', 'y'),
+    'GLOBAL_POSITION_INT': ('lat', 'lon', 'relative_alt'),
+    'POSITION': ('Lat', 'Lon', 'RelAlt'),
+    'NAV_CONTROLLER_OUTPUT': ('nav_bearing', 'target_bearing'),
+}
+
+# Message types that can carry GNSS location data; everything else passes through
+GNSS_MESSAGE_TYPES = frozenset(GNSS_LOCATION_FIELDS)
+
+# Header bytes of a binary DataFlash message, and the layout of an FMT message body
+DF_HEAD1 = 0xA3
+DF_HEAD2 = 0x95
+DF_FMT_TYPE = 0x80
+DF_FMT_BODY = struct.Struct('<BB4s16s64s')
+
 
 def has_gps_location(message):
     """
@@ -26,69 +55,94 @@ def has_gps_location(message):
     Returns True if the message has GNSS location data, False otherwise.
     Safely handles messages without GNSS fields.
     """
-    # Define message types that typically contain GNSS location data
-    gps_messages = {
-        'GPS',
-        'POS',
-        'ORGN',
-        'TERR',
-        'AHR2',
-        'EAHR',
-        'MISSION_ITEM',
-        'GLOBAL_POSITION_INT',
-        'POSITION',
-        'NAV_CONTROLLER_OUTPUT',
-    }
-
-    # Get message type from the message name
-    msg_type = message.get_type()
-
-    if msg_type not in gps_messages:
-        return False  # Non-GNSS messages are not filtered
-
-    # Safely check specific fields for GNSS location data, handling missing attributes
-    try:
-        if msg_type == 'GPS':
-            return (hasattr(message, 'Lat') and message.Lat != 0 or
-                    hasattr(message, 'Lon') and message.Lon != 0)
-        elif msg_type == 'POS':
-            return (hasattr(message, 'Lat') and message.Lat != 0 or
-                    hasattr(message, 'Lng') and message.Lon != 0)
-        elif msg_type == 'ORGN':
-            return (hasattr(message, 'Lat') and message.Lat != 0 or
-                    hasattr(message, 'Lng') and message.Lon != 0)
-        elif msg_type == 'TERR':
-            return (hasattr(message, 'Lat') and message.Lat != 0 or
-                    hasattr(message, 'Lng') and message.Lon != 0)
-        elif msg_type == 'AHR2':
-            return (hasattr(message, 'Lat') and message.Lat != 0 or
-                    hasattr(message, 'Lng') and message.Lon != 0)
-        elif msg_type == 'EAHR':
-            return (hasattr(message, 'Lat') and message.Lat != 0 or
-                    hasattr(message, 'Lon') and message.Lon != 0)
-        elif msg_type == 'GLOBAL_POSITION_INT':
-            return (hasattr(message, 'lat') and message.lat != 0 or
-                    hasattr(message, 'lon') and message.lon != 0 or
-                    hasattr(message, 'relative_alt') and message.relative_alt != 0)
-        elif msg_type == 'POSITION':
-            return (hasattr(message, 'Lat') and message.Lat != 0 or
-                    hasattr(message, 'Lon') and message.Lon != 0 or
-                    hasattr(message, 'RelAlt') and message.RelAlt != 0)
-        elif msg_type == 'NAV_CONTROLLER_OUTPUT':
-            return (hasattr(message, 'nav_bearing') and message.nav_bearing != 0 or
-                    hasattr(message, 'target_bearing') and message.target_bearing != 0)
-        elif msg_type == 'MISSION_ITEM':
-            return (hasattr(message, 'x') and message.x != 0 or
-                    hasattr(message, 'y') and message.y != 0)
-    except AttributeError:
-        return False  # If any field check fails, assume no GNSS location data
-
-
-def filter_log_without_gps(input_file, output_file=None):
+    # Non-GNSS messages have no fields to check and are not filtered
+    for field in GNSS_LOCATION_FIELDS.get(message.get_type(), ()):
+        if getattr(message, field, 0) != 0:
+            return True
+    return False
+
+
+def gnss_field_readers(fmt):
+    """
+    Return (unpack_from, offset) pairs reading the GNSS location fields of a
+    DataFlash format straight from raw message bytes, or None for non-GNSS formats.
+    """
+    fields = GNSS_LOCATION_FIELDS.get(fmt.name)
+    if fields is None:
+        return None
+    codes = [DFReader.FORMAT_TO_STRUCT[c][0] for c in fmt.msg_fmts]
+    readers = []
+    for field in fields:
+        i = fmt.colhash.get(field)
+        if i is None or i >= len(codes):
+            continue  # Missing fields never hold location data
+        # 3 header bytes plus the size of every column before this one
+        offset = 3 + struct.calcsize('<' + ''.join(codes[:i]))
+        readers.append((struct.Struct('<' + codes[i]).unpack_from, offset))
+    return tuple(readers)
+
+
+def iter_binary_log(mlog):
+    """
+    Yield (msg_type, has_gnss, raw) for each message of a binary DataFlash log.
+    Messages are walked directly in DFReader's memory map and only the GNSS
+    location fields are unpacked, instead of decoding every message.
+    """
+    data = mlog.data_map
+    data_len = mlog.data_len
+    formats = {DF_FMT_TYPE: mlog.formats[DF_FMT_TYPE]}
+    readers = {DF_FMT_TYPE: None}
+    ofs = 0
+    while ofs + 3 <= data_len:
+        type_id = data[ofs + 2]
+        if data[ofs] != DF_HEAD1 or data[ofs + 1] != DF_HEAD2 or type_id not in formats:
+            ofs += 1  # Skip bad data up to the next known message, as DFReader does
+            continue
+        fmt = formats[type_id]
+        end = ofs + fmt.len
+        if end > data_len:
+            break  # Logs often end with a partly written message
+
+        if type_id == DF_FMT_TYPE:
+            # Track formats in log order, in case combined logs reuse type ids
+            ftype, flen, name, fmt_chars, columns = DF_FMT_BODY.unpack_from(data, ofs + 3)
+            try:
+                new_fmt = DFReader.DFFormat(ftype, DFReader.null_term(name), flen,
+                                            DFReader.null_term(fmt_chars), DFReader.null_term(columns))
+                formats[ftype] = new_fmt
+                readers[ftype] = gnss_field_readers(new_fmt)
+            except Exception as e:
+                print(f"Error message FMT: {e}")
+
+        field_readers = readers[type_id]
+        has_gnss = field_readers is not None and any(
+            unpack_from(data, ofs + offset)[0] != 0 for unpack_from, offset in field_readers)
+        yield fmt.name, has_gnss, data[ofs:end]
+        ofs = end
+
+
+def iter_log(mlog):
+    """Yield (msg_type, has_gnss, raw) for each message decoded by pymavlink."""
+    while True:
+        msg = mlog.recv_match(blocking=False)
+        if msg is None:
+            break  # End of file
+
+        msg_type = msg.get_type()
+        # Only the few GNSS message types need their fields checked
+        if msg_type in GNSS_MESSAGE_TYPES and has_gps_location(msg):
+            yield msg_type, True, None
+        else:
+            # Convert DFMessage to MAVLink_message and pack it
+            yield msg_type, False, msg.get_msgbuf()
+
+
+def filter_log_without_gps(input_file, output_file=None, verbose=False):
     """
     Read an ArduPilot binary log, filter out entries with GNSS location data,
     and save the result to a new binary log. Report removed and passed entries.
     Skip non-filter-relevant messages like PARM during packing.
+    Each removed message is only reported individually when verbose is set.
     """
     if not os.path.exists(input_file):
         print(f"Error: Input file '{input_file}' not found.")
@@ -104,8 +158,15 @@ def filter_log_without_gps(input_file, output_file=None):
     # Create a MAVLink instance using the ardupilotmega dialect
     mav = ardupilotmega.MAVLink(None)
 
+    # Binary logs are memory mapped by DFReader, so their messages can be
+    # checked and copied as raw bytes instead of being decoded and packed again
+    if isinstance(mlog, DFReader.DFReader_binary):
+        messages = iter_binary_log(mlog)
+    else:
+        messages = iter_log(mlog)
+
     # Create or open the output log file
-    with open(output_file, 'wb') as outfile:
+    with open(output_file, 'wb', buffering=WRITE_BUFFER_SIZE) as outfile:
         print(f"Processing log file: {input_file}")
         print(f"Writing filtered log to: {output_file}")
 
@@ -117,28 +178,23 @@ def filter_log_without_gps(input_file, output_file=None):
         msg_type_counts_removed = defaultdict(int)
 
         # Process each message in the log
-        while True:
-            msg = mlog.recv_match(blocking=False)
-            if msg is None:
-                break  # End of file
-
+        for msg_type, has_gnss, raw in messages:
             msg_count += 1
-            msg_type = msg.get_type()
-
-            if not has_gps_location(msg):
-                # Convert DFMessage to MAVLink_message and pack it
-                try:
-                    outfile.write(msg.get_msgbuf())
-                    passed_count += 1
-                    msg_type_counts_passed[msg_type] += 1
-                except Exception as e:
-                    print(f"Error message {msg_type}: {e}")
-                    continue
-            else:
+
+            if has_gnss:
                 removed_count += 1
                 msg_type_counts_removed[msg_type] += 1
-                print(
-                    f"{removed_count}:\tRemoved message {msg_type} with GNSS location data.")
+                if verbose:
+                    print(
+                        f"{removed_count}:\tRemoved message {msg_type} with GNSS location data.")
+                continue
+
+            if raw is None:  # get_msgbuf() could not pack the message
+                print(f"Error message {msg_type}: could not be packed")
+                continue
+            outfile.write(raw)
+            passed_count += 1
+            msg_type_counts_passed[msg_type] += 1
 
         print(f"\nProcessed {msg_count} total messages.")
         print(f"Removed {removed_count} entries with GNSS location data.")
@@ -157,16 +213,19 @@ def filter_log_without_gps(input_file, output_file=None):
 
 
 def main():
-    # Get input file from command-line arguments
-    if len(sys.argv) < 2:
-        print("Usage: python script.py input_log.bin [output_log.bin]")
-        print("If output file is not specified, defaults to 'input_log_no_gnss.bin'")
-        sys.exit(1)
-
-    input_log = sys.argv[1]
-    output_log = sys.argv[2] if len(sys.argv) > 2 else None
-
-    filter_log_without_gps(input_log, output_log)
+    # Parse command-line arguments
+    parser = argparse.ArgumentParser(
+        description="Remove messages with GNSS location data from a MAVLink log file.")
+    parser.add_argument(
+        "input_log", help="Path to the input MAVLink log file.")
+    parser.add_argument(
+        "output_log", nargs="?", default=None,
+        help="Path to save the filtered log file (default: <input_log>-no-gnss.bin).")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Print every removed message")
+    args = parser.parse_args()
+
+    filter_log_without_gps(args.input_log, args.output_log, args.verbose)
 
 
 if __name__ == "__main__":